@@ -1,5 +1,6 @@
-from twentyone.environment import Blackjack
+from twentyone.environment import Blackjack, WIN_STATE, is_hand_state
 from twentyone.agents import initialize_agent
+from twentyone.ensemble import create_ensemble
 import argparse
 from collections import defaultdict
 import json
@@ -16,6 +17,7 @@ def main():
         --alpha: Learning rate
         --gamma: Discount factor 
         --epsilon: Exploration probability threshold
+        --ensemble_path: Optional directory for a memory-mapped float32 ensemble of the agents' tables
 
     Raises
     ------
@@ -34,25 +36,42 @@ def main():
     parser.add_argument("--gamma", type=float, required=False, default=0.9, help="Discount factor")
     parser.add_argument("--epsilon", type=float, required=False, default=0.2, help="Exploration probability threshold")
     parser.add_argument("--output_path", type=str, required=False, default='results/', help="Output path to save results")
+    parser.add_argument("--ensemble_path", type=str, required=False, default=None, help="Directory to store the agents' tables in a memory-mapped ensemble")
     args = parser.parse_args()
+
+    ensemble = None
     
     # iterate over the agents
     for i in range(args.num_agents):
 
-        # initialize the environment and agent
+        # initialize the environment and agent, placing the agent's tables in the ensemble if there is one
         environment = Blackjack()
-        agent = initialize_agent(environment, args)
+        if args.ensemble_path is not None:
+            if ensemble is None:
+                ensemble = create_ensemble(args.ensemble_path, args.num_agents, 1, environment.get_number_of_states(),
+                                           environment.get_number_of_actions(), kind='hand')
+            q_table, n_table = ensemble.agent_tables(i)
+            agent = initialize_agent(environment, args, q_table[0], n_table[0])
+        else:
+            agent = initialize_agent(environment, args)
     
         # play the episodes
         wins = 0
         cumulative_reward = 0
         metrics = defaultdict(list)
         for e in range(args.num_episodes):
-            current_state = environment.reset()
-            game_end = False
+            # reshuffle once 40% of the cards are left
+            if environment.deck.needs_shuffle():
+                environment.shuffle()
+
+            # a natural pays 1.5x and ends the episode on the deal
+            current_state, _ = environment.reset()
+            reward = 1.5 if current_state == WIN_STATE else 0
+            game_end = not is_hand_state(current_state)
             while not game_end:
                 action = agent.select_action(current_state)
-                new_state, reward, game_end = environment.execute_action(action)
+                new_state, reward, _ = environment.execute_action(action)
+                game_end = not is_hand_state(new_state)
                 agent.update(current_state, action, reward, new_state)
                 current_state = new_state
 
@@ -61,7 +80,7 @@ def main():
                 agent.update_tables()
 
             # record a win if episode ended with a reward
-            wins += 1 if reward == 1 else 0
+            wins += 1 if reward > 0 else 0
             cumulative_reward += reward
 
             # record the metrics
@@ -80,6 +99,9 @@ def main():
         
         print(f"Agent {i} trained successfully.\n")
 
+    if ensemble is not None:
+        ensemble.flush()
+
     print("\nProgram completed successfully.\n")
         
 
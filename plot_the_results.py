@@ -2,6 +2,7 @@ import json
 import pandas as pd
 import matplotlib.pyplot as plt
 import argparse
+from twentyone.ensemble import QTableEnsemble
 
 
 def get_agent_metrics(agent_num, args):
@@ -16,6 +17,30 @@ def get_agent_metrics(agent_num, args):
     return metrics
 
 
+def plot_ensemble(ensemble_path, agent_args):
+    """
+    Plot the Q values averaged over an ensemble of agents, read directly from the memory-mapped ensemble files.
+    Ensembles of betting agents (state 200 holds the bet-size decision) are plotted as the value of each bet by
+    count bucket, others as the greedy value of each state
+    """
+    ensemble = QTableEnsemble(ensemble_path)
+    mean_q = ensemble.mean_q()
+
+    fig, ax = plt.subplots(1, 1, figsize=(7, 5))
+    if ensemble.kind == 'bet':
+        for action in range(ensemble.num_actions):
+            plt.plot(mean_q[:, 200, action], label=f'Bet {action}')
+        ax.set_title('Average Bet Values')
+        ax.xaxis.set_label_text('Count Bucket')
+        ax.legend()
+    else:
+        plt.plot(mean_q[0].max(axis=1))
+        ax.set_title('Average State Values')
+        ax.xaxis.set_label_text('State')
+    ax.yaxis.set_label_text('Value')
+    plt.savefig(f'results/Ensemble_{agent_args}.png')
+
+
 def plot_metrics():
     """
     Plot all the metrics for the agents and the average
@@ -32,11 +57,15 @@ def plot_metrics():
     parser.add_argument("--gamma", type=float, required=False, default=0.9, help="Discount factor")
     parser.add_argument("--epsilon", type=float, required=False, default=0.2, help="Exploration probability threshold")
     parser.add_argument("--get_all_results", action='store_true', default=False, required=False, help="Flag to get all results")
+    parser.add_argument("--ensemble_path", type=str, required=False, default=None, help="Directory of a memory-mapped ensemble of the agents' tables to plot")
     args = parser.parse_args()
 
     agent_args = f"{args.algorithm}_{args.num_episodes}_{args.alpha}_{args.gamma}_{args.epsilon}"
     print((f"\nGathering results for {agent_args}\n"))
 
+    if args.ensemble_path is not None:
+        plot_ensemble(args.ensemble_path, agent_args)
+
     win = pd.DataFrame()
     rewards = pd.DataFrame()
     for i in range(args.num_agents):
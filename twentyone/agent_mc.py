@@ -16,9 +16,18 @@ import numpy as np
 class RLAgent:
     """RL agent for the blackjack"""
 
-    def __init__(self, hi_lo):
+    def __init__(self, hi_lo, q=None, q_count=None):
+        """
+        :param hi_lo: True if the agent keeps separate tables for each Hi-Lo count bucket
+        :param q: optional q table shaped (counts, states, actions) to update in place, e.g. a view into a
+        QTableEnsemble; the agent allocates its own float64 tables if omitted
+        :param q_count: optional q_count table shaped like q
+        """
         self.hi_lo = hi_lo
-        if self.hi_lo:
+        if q is not None:
+            self.q = q
+            self.q_count = q_count
+        elif self.hi_lo:
             self.q = [np.zeros((204, 3), dtype="float64") for _ in range(30)]  # the q value for each state-action
             self.q_count = [np.zeros((201, 3), dtype="float64") for _ in range(30)]  # for tracking how many visits the agent has made to each state-action
         else:
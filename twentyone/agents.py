@@ -1,11 +1,15 @@
 import numpy as np
 
 
-def initialize_agent(environment, args):
+def initialize_agent(environment, args, q_table=None, n_table=None):
+    """
+    q_table and n_table optionally give the agent existing tables to update in place, such as views into a
+    QTableEnsemble; otherwise the agent allocates its own.
+    """
     if args.algorithm == 'MCC':
-        agent = MonteCarloControl(environment, args.gamma, args.epsilon)
+        agent = MonteCarloControl(environment, args.gamma, args.epsilon, q_table, n_table)
     elif args.algorithm == 'Q':
-        agent = QLearning(environment, args.alpha, args.gamma, args.epsilon)
+        agent = QLearning(environment, args.alpha, args.gamma, args.epsilon, q_table, n_table)
     elif args.algorithm == 'MCC':
         agent = DeepQLearning(environment, args.alpha, args.gamma, args.epsilon) # just placeholder args for now
     else:
@@ -14,12 +18,12 @@ def initialize_agent(environment, args):
 
 
 class MonteCarloControl:
-    def __init__(self, env, gamma=1, epsilon=0.2):
+    def __init__(self, env, gamma=1, epsilon=0.2, q_table=None, n_table=None):
         self.env = env
         self.num_states = env.get_number_of_states()
         self.num_actions = env.get_number_of_actions()
-        self.q_table = np.zeros((self.num_states, self.num_actions)) # initialize q_table with zeros
-        self.n_table = np.zeros((self.num_states, self.num_actions)) # initialize n_table with zeros
+        self.q_table = np.zeros((self.num_states, self.num_actions)) if q_table is None else q_table # initialize q_table with zeros
+        self.n_table = np.zeros((self.num_states, self.num_actions)) if n_table is None else n_table # initialize n_table with zeros
         self.gamma = gamma
         self.epsilon = epsilon
         self.trajectory = []
@@ -82,11 +86,12 @@ class MonteCarloControl:
 
 
 class QLearning:
-    def __init__(self, env, alpha=0.1, gamma=1, epsilon=0.2):
+    def __init__(self, env, alpha=0.1, gamma=1, epsilon=0.2, q_table=None, n_table=None):
         self.env = env
         self.num_states = env.get_number_of_states()
         self.num_actions = env.get_number_of_actions()
-        self.q_table = np.zeros((self.num_states, self.num_actions)) # initialize q_table with zeros
+        self.q_table = np.zeros((self.num_states, self.num_actions)) if q_table is None else q_table # initialize q_table with zeros
+        self.n_table = np.zeros((self.num_states, self.num_actions)) if n_table is None else n_table # visits to each state-action
         self.alpha = alpha # learning rate
         self.gamma = gamma # discount rate
         self.epsilon = epsilon # exploration probability threshold
@@ -112,6 +117,7 @@ class QLearning:
         return action
 
     def update(self, state, action, reward, new_state):
+        self.n_table[state, action] += 1
         q = self.q_table[state, action]
         self.q_table[state, action] = q + self.alpha*(reward + self.gamma*np.max(self.q_table[new_state, ]) - q)
 
@@ -0,0 +1,150 @@
+"""
+Filename: ensemble.py
+
+Project: twentyone
+
+Description: Compact Q and visit-count tables for ensembles of agents, stored in memory-mapped .npy files shaped
+(agents, counts, states, actions).  Q values are stored as float32, or as int16 scaled by a fixed factor, and visit
+counts as int32, so that an agent takes 2-3x less memory than with float64 tables.  Averaging reads the files
+a chunk of agents at a time rather than loading the whole ensemble.
+
+Author:
+
+Date:
+"""
+
+import json
+import os
+import numpy as np
+
+Q_FILE = 'q.npy'
+Q_COUNT_FILE = 'q_count.npy'
+META_FILE = 'meta.json'
+
+
+def create_ensemble(path, num_agents, num_counts=30, num_states=204, num_actions=3, dtype="float32", scale=1000,
+                    kind='bet'):
+    """
+    Create the files for a new ensemble, overwriting any existing ensemble at path
+    :param path: the directory holding the ensemble
+    :param num_agents: the number of agents in the ensemble
+    :param num_counts: the number of Hi-Lo count buckets (1 for agents that do not count cards)
+    :param num_states: the number of states in each agent's table
+    :param num_actions: the number of actions in each agent's table
+    :param dtype: "float32", or "int16" for Q values stored as integers scaled by scale
+    :param scale: the factor Q values are multiplied by when stored as int16
+    :param kind: 'bet' for agents whose state 200 holds the bet-size decision, 'hand' for agents that only play hands
+    :return: the ensemble, opened for writing
+    """
+    if dtype not in ("float32", "int16"):
+        raise ValueError('dtype must be one of float32, int16.')
+    if kind not in ('bet', 'hand'):
+        raise ValueError('kind must be one of bet, hand.')
+
+    os.makedirs(path, exist_ok=True)
+    shape = (num_agents, num_counts, num_states, num_actions)
+    with open(os.path.join(path, META_FILE), 'wt') as f:
+        json.dump({'shape': shape, 'dtype': dtype, 'scale': scale, 'kind': kind}, f)
+
+    # open_memmap writes the .npy header and zero-fills the tables without holding them in memory
+    np.lib.format.open_memmap(os.path.join(path, Q_FILE), mode='w+', dtype=dtype, shape=shape).flush()
+    np.lib.format.open_memmap(os.path.join(path, Q_COUNT_FILE), mode='w+', dtype="int32", shape=shape).flush()
+
+    return QTableEnsemble(path, mode='r+')
+
+
+class QTableEnsemble:
+    """Memory-mapped Q and visit-count tables for an ensemble of agents"""
+
+    def __init__(self, path, mode='r'):
+        """
+        :param path: the directory holding the ensemble
+        :param mode: 'r' to read the ensemble, 'r+' to also write to it
+        """
+        with open(os.path.join(path, META_FILE), 'rt') as f:
+            meta = json.load(f)
+        self.path = path
+        self.dtype = meta['dtype']
+        self.scale = meta['scale']
+        self.kind = meta.get('kind', 'hand')
+        self.q = np.load(os.path.join(path, Q_FILE), mmap_mode=mode)
+        self.q_count = np.load(os.path.join(path, Q_COUNT_FILE), mmap_mode=mode)
+        self.num_agents, self.num_counts, self.num_states, self.num_actions = self.q.shape
+
+    def is_quantized(self):
+        return self.dtype == "int16"
+
+    def agent_tables(self, agent):
+        """
+        Views of one agent's tables that the agent can update in place, so that nothing needs saving afterwards.
+        Only available for float32 ensembles; int16 ensembles are written with store
+        :param agent: the index of the agent
+        :return: the agent's q table and q_count table, each shaped (counts, states, actions)
+        """
+        if self.is_quantized():
+            raise ValueError('Tables of an int16 ensemble cannot be updated in place; use store instead.')
+        return self.q[agent], self.q_count[agent]
+
+    def store(self, agent, q, q_count):
+        """
+        Copy an agent's tables into the ensemble, scaling and rounding the Q values for int16 ensembles
+        :param agent: the index of the agent
+        :param q: the agent's q table, or a list of one table per count bucket
+        :param q_count: the agent's q_count table, or a list of one table per count bucket.  Tables with fewer
+        states than the ensemble fill its first rows
+        :return: n/a
+        """
+        for count, values in enumerate(q):
+            values = np.asarray(values)
+            if self.is_quantized():
+                info = np.iinfo(self.q.dtype)
+                values = np.clip(np.rint(values * self.scale), info.min, info.max)
+            self.q[agent, count, :values.shape[0], :values.shape[1]] = values
+
+        for count, values in enumerate(q_count):
+            values = np.asarray(values)
+            self.q_count[agent, count, :values.shape[0], :values.shape[1]] = values
+
+    def agent_q(self, agent):
+        """
+        :param agent: the index of the agent
+        :return: the agent's q table as float64, shaped (counts, states, actions)
+        """
+        q = np.asarray(self.q[agent], dtype="float64")
+        if self.is_quantized():
+            q /= self.scale
+        return q
+
+    def mean_q(self, chunk_size=256):
+        """
+        Average the Q values over the agents, reading a chunk of agents at a time
+        :param chunk_size: the number of agents read at once
+        :return: the mean q table as float64, shaped (counts, states, actions)
+        """
+        total = self.sum_over_agents(self.q, chunk_size)
+        if self.is_quantized():
+            total /= self.scale
+        return total / self.num_agents
+
+    def mean_q_count(self, chunk_size=256):
+        """
+        Average the visit counts over the agents, reading a chunk of agents at a time
+        :param chunk_size: the number of agents read at once
+        :return: the mean q_count table as float64, shaped (counts, states, actions)
+        """
+        return self.sum_over_agents(self.q_count, chunk_size) / self.num_agents
+
+    def sum_over_agents(self, tables, chunk_size):
+        total = np.zeros(tables.shape[1:], dtype="float64")
+        for start in range(0, self.num_agents, chunk_size):
+            total += tables[start:start + chunk_size].sum(axis=0, dtype="float64")
+        return total
+
+    def flush(self):
+        """
+        Write any changes still held in memory to the files
+        :return: n/a
+        """
+        for table in (self.q, self.q_count):
+            if isinstance(table, np.memmap):
+                table.flush()
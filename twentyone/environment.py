@@ -12,6 +12,54 @@ Date:
 
 import math
 import random
+import numpy as np
+
+# agent actions
+STICK = 0
+HIT = 1
+DOUBLE = 2
+SPLIT = 3
+SURRENDER = 4
+
+# terminal state codes (states 0-199 are hands and 200 is the agents' bet-size decision)
+LOSS_STATE = 201
+TIE_STATE = 202
+WIN_STATE = 203
+WAIT_STATE = 204    # table play only: the seat has finished its hands and waits for the dealer
+
+# two-card hands totalling 4-11 that may double, split or surrender are played from states
+# LOW_STATE + (total - 4) + 8 * (dealer card - 1), so that the codes above stay unchanged
+LOW_STATE = 205
+NUM_STATES = LOW_STATE + 80
+
+
+def is_hand_state(state):
+    """
+    :param state: a state code, or an array of them
+    :return: True where the state is a hand the agent still has to act on
+    """
+    return (state < 200) | (state >= LOW_STATE)
+
+
+# the shoe is reshuffled once fewer than this many cards (40% of the 6 decks) are left
+CUT_CARD = 125
+
+# change to the Hi-Lo running count for each card value (index 0 is unused)
+HI_LO = (0, -1, 1, 1, 1, 1, 1, 0, 0, 0, -1)
+
+# the feature vector of a seat: 10 deck-composition columns (cards of each value left in the shoe, divided by
+# CARD_STATE_SCALE) followed by the agent's hand, usable ace, dealer's card and betting-phase flag
+NUM_FEATURES = 14
+CARD_STATE_SCALE = 96
+HAND_FEATURE = 10
+ACE_FEATURE = 11
+DEALER_FEATURE = 12
+BETTING_FEATURE = 13
+
+# flags describing the current decision; combined, they index the precompiled action table
+_OPENING = 1        # first decision on a two-card hand
+_PAIR = 2           # two-card hand of equal cards that may still be split
+_SPLIT_HAND = 4     # hand created by a split
 
 
 class CardDeck:
@@ -30,87 +78,448 @@ class CardDeck:
         # shuffle the cards
         random.shuffle(self.cards)
 
-    def deal_card(self):
-        return self.cards.pop(0)
+        # the number of cards of each value left in the shoe, not counting cards still face down, and an optional
+        # (N, NUM_FEATURES) feature buffer whose deck-composition columns are kept up to date as cards are seen
+        self.remaining = [24, 24, 24, 24, 24, 24, 24, 24, 24, 96]
+        self.features = None
+
+    def get_card_state(self):
+        """
+        :return: the number of cards of each value (ace through ten) left in the shoe, as far as the agent can see
+        """
+        return list(self.remaining)
+
+    def attach_features(self, features):
+        """
+        Keep the deck-composition columns of a feature buffer up to date as cards are dealt
+        :param features: a float array shaped (N, NUM_FEATURES)
+        :return: n/a
+        """
+        self.features = features
+        features[:, :10] = np.array(self.remaining) / CARD_STATE_SCALE
+
+    def needs_shuffle(self):
+        """
+        :return: True once the cut card has been reached
+        """
+        return len(self.cards) < CUT_CARD
+
+    def deal_card(self, hidden=False):
+        """
+        :param hidden: True for a card dealt face down, which is left out of the card state until revealed
+        :return: the card
+        """
+        # the cards are shuffled, so dealing from the end is as random as from the front and avoids shifting the list
+        card = self.cards.pop()
+        if hidden:
+            return card
+        self.remaining[card - 1] -= 1
+        if self.features is not None:
+            self.features[:, card - 1] = self.remaining[card - 1] / CARD_STATE_SCALE
+        return card
+
+    def reveal(self, card):
+        """
+        Take a card dealt face down out of the card state once it is turned over
+        :param card: the card
+        :return: n/a
+        """
+        self.remaining[card - 1] -= 1
+        if self.features is not None:
+            self.features[:, card - 1] = self.remaining[card - 1] / CARD_STATE_SCALE
+
+
+class TableRules:
+    """
+    Rules of the table.  The defaults reproduce the original game: hit or stick only, dealer sticks on soft 17
+    """
+
+    def __init__(self, hit_soft_17=False, double_down=False, double_after_split=False, split=False,
+                 max_split_hands=4, hit_split_aces=False, surrender=False, dealer_peek=False):
+        """
+        :param hit_soft_17: True if the dealer hits a soft 17
+        :param double_down: True if the agent may double its bet on the first two cards and take exactly one card
+        :param double_after_split: True if doubling is also allowed on hands created by a split
+        :param split: True if the agent may split a pair into two hands
+        :param max_split_hands: the most hands the agent may hold after splitting
+        :param hit_split_aces: True if split aces may be played on; otherwise each takes one card and sticks
+        :param surrender: True if the agent may give up half its bet on the first decision of the hand.  Without
+        dealer_peek this is early surrender, allowed even when the dealer turns out to hold a natural
+        :param dealer_peek: True if the dealer checks the hole card for a natural before the agent acts.  A dealer
+        natural then ends the hand at once: reset returns LOSS_STATE and the agent loses only its original bet
+        (ties with a natural as before).  Without the peek, a dealer natural takes every doubled and split bet
+        """
+        if max_split_hands < 2:
+            raise ValueError('max_split_hands must be at least 2.')
+        self.hit_soft_17 = hit_soft_17
+        self.double_down = double_down
+        self.double_after_split = double_after_split
+        self.split = split
+        self.max_split_hands = max_split_hands
+        self.hit_split_aces = hit_split_aces
+        self.surrender = surrender
+        self.dealer_peek = dealer_peek
 
 
 class Blackjack:
-    def __init__(self):
+    def __init__(self, rules=None, deck=None, features=None):
 
-        self.deck = CardDeck()
+        self.rules = TableRules() if rules is None else rules
+        self.deck = CardDeck() if deck is None else deck
+
+        # optional normalized features of the current state (see enable_features); a table passes in a row of its
+        # buffer.  Without a buffer, no features are written
+        self.features = features
+        self.shared_dealer = False      # True when a BlackjackTable plays the dealer for all of its seats
+        self.hole_card = 0              # the dealer's face-down card, until the end of the hand reveals it
         self.agent_total = 0
         self.usable_ace = 0
         self.dealer_card = 0
         self.dealer_total = 0
         self.dealer_ace = 0
         self.current_state = 0
+        self.decision = 0
+        self.bet_multiplier = 1         # 2 once the current hand has doubled down
+        self.split_hands = []           # first cards of split hands still waiting to be played
+        self.finished_hands = []        # (total, bet multiplier) of played hands; a total of 0 is a bust
+
+        # precompile the rule checks so that the hit/stick path pays nothing for the extra rules.
+        # dealer_hits[soft][total] is True if the dealer draws on that total
+        self.dealer_hits = [[total < 17 for total in range(32)],
+                            [total < 17 or (total == 17 and self.rules.hit_soft_17) for total in range(32)]]
+
+        # action_table[decision] holds the legal actions for a combination of the _OPENING, _PAIR and
+        # _SPLIT_HAND flags
+        self.action_table = []
+        for decision in range(8):
+            actions = [STICK, HIT]
+            if decision & _OPENING:
+                if self.rules.double_down and (self.rules.double_after_split or not decision & _SPLIT_HAND):
+                    actions.append(DOUBLE)
+                if self.rules.split and decision & _PAIR:
+                    actions.append(SPLIT)
+                if self.rules.surrender and not decision & _SPLIT_HAND:
+                    actions.append(SURRENDER)
+            self.action_table.append(tuple(actions))
 
     def get_state_index(self):
+        if self.agent_total < 12:
+            return LOW_STATE + (self.agent_total - 4) + 8 * (self.dealer_card - 1)
         a_idx = self.agent_total - 12
         d_idx = 10 * (self.dealer_card - 1)
         u_idx = 100 * self.usable_ace
         return a_idx + d_idx + u_idx
 
+    def get_card_state(self):
+        return self.deck.get_card_state()
+
+    def get_number_of_states(self):
+        """
+        :return: the number of state codes, for sizing an agent's tables
+        """
+        return NUM_STATES
+
+    def get_number_of_actions(self):
+        """
+        :return: the number of actions the rules allow, for sizing an agent's tables
+        """
+        return max(max(actions) for actions in self.action_table) + 1
+
+    def shuffle(self):
+        """
+        Replace the shoe with freshly shuffled decks
+        :return: n/a
+        """
+        features = self.deck.features
+        self.deck = CardDeck()
+        if features is not None:
+            self.deck.attach_features(features)
+
+    def enable_features(self):
+        """
+        Turn on the feature buffer, which is updated in place as cards are dealt so that it can be shared with a
+        torch tensor (torch.from_numpy) without copying.  It is off by default, so that agents that do not read it
+        pay nothing for it
+        :return: the feature buffer, shaped (NUM_FEATURES,)
+        """
+        if self.features is None:
+            features = np.zeros((1, NUM_FEATURES), dtype="float32")
+            self.deck.attach_features(features)
+            self.features = features[0]
+        return self.features
+
+    def update_hand_features(self):
+        """
+        Write the agent's hand, usable ace and the dealer's card into the feature buffer
+        :return: n/a
+        """
+        features = self.features
+        features[HAND_FEATURE] = (self.agent_total - 11) / 10
+        features[ACE_FEATURE] = self.usable_ace
+        features[DEALER_FEATURE] = self.dealer_card / 10
+
+    def betting_features(self):
+        """
+        Switch the feature buffer to the bet-size decision made before a hand is dealt, turning it on if needed
+        :return: the feature buffer
+        """
+        features = self.enable_features()
+        features[HAND_FEATURE:BETTING_FEATURE] = 0
+        features[BETTING_FEATURE] = 1
+        return features
+
+    def is_opening(self):
+        """
+        :return: True if this is the first decision on a two-card hand
+        """
+        return bool(self.decision & _OPENING)
+
+    def legal_actions(self):
+        """
+        :return: the actions the agent may take from the current state
+        """
+        if not is_hand_state(self.current_state):
+            return ()
+        return self.action_table[self.decision]
+
     def get_next_state(self, open_cards):
         new_card = self.deck.deal_card()
         open_cards.append(new_card)
         self.agent_total += new_card
+        if new_card == 1 and self.usable_ace == 0 and self.agent_total < 12:
+            self.usable_ace = 1
+            self.agent_total += 10
         if self.agent_total > 21 and self.usable_ace == 1:
             self.usable_ace = 0
             self.agent_total -= 10
         if self.agent_total > 21:
-            new_state = 201      # 201 is the losing state
+            new_state = LOSS_STATE      # the agent is bust
         else:
             new_state = self.get_state_index()
+            if self.features is not None:
+                self.update_hand_features()
         return new_state, open_cards
 
-    def reset(self):
-        self.agent_total = 0
+    def open_hand(self, card_1, card_2, split_hand):
+        """
+        Set the agent's total from the first two cards of a hand and flag the decisions open to it
+        :param card_1: the first card of the hand
+        :param card_2: the second card of the hand
+        :param split_hand: _SPLIT_HAND if the hand was created by a split, else 0
+        :return: n/a
+        """
+        self.agent_total = card_1 + card_2
         self.usable_ace = 0
-        self.dealer_card = 0
-        self.dealer_total = 0
-        self.dealer_ace = 0
-        self.current_state = 0
+        if card_1 == 1 or card_2 == 1:
+            self.usable_ace = 1
+            self.agent_total += 10
+
+        self.decision = _OPENING | split_hand
+        if card_1 == card_2 and self.rules.split:
+            hands = len(self.finished_hands) + len(self.split_hands) + 1
+            if hands < self.rules.max_split_hands:
+                self.decision |= _PAIR
+
+    def auto_hit(self, open_cards):
+        """
+        Deal enough cards to the agent so that the total is >11
+        :param open_cards: the cards dealt so far this step
+        :return: the state of the hand
+        """
+        while self.agent_total < 12:
+            new_card = self.deck.deal_card()
+            open_cards.append(new_card)
+            self.agent_total += new_card
+            if new_card == 1 and self.usable_ace == 0 and self.agent_total < 12:
+                self.usable_ace = 1
+                self.agent_total += 10
 
+            # the hand is no longer a two-card hand
+            self.decision = 0
+
+        if self.features is not None:
+            self.update_hand_features()
+        return self.get_state_index()
+
+    def start_hand(self, open_cards):
+        """
+        Determine the state of a new two-card hand.  A hand below 12 keeps its opening decision (in one of the
+        low-total states) if it may double, split or surrender; otherwise it is hit automatically
+        :param open_cards: the cards dealt so far this step
+        :return: the state of the hand
+        """
+        if self.agent_total >= 12 or len(self.action_table[self.decision]) > 2:
+            if self.features is not None:
+                self.update_hand_features()
+            return self.get_state_index()
+        return self.auto_hit(open_cards)
+
+    def reset(self):
         # deal a face up card and a second card to the dealer
         self.dealer_card = self.deck.deal_card()
-        d_card_2 = self.deck.deal_card()
+        d_card_2 = self.deck.deal_card(hidden=True)
+        self.hole_card = d_card_2
         self.dealer_total = self.dealer_card + d_card_2
+        self.dealer_ace = 0
         if self.dealer_card == 1 or d_card_2 == 1:
             self.dealer_ace = 1
             self.dealer_total += 10
 
-        # deal two cards to the agent
-        card_1 = self.deck.deal_card()
-        card_2 = self.deck.deal_card()
-        open_cards = [d_card_2, card_1, card_2]
-        self.agent_total = card_1 + card_2
-        if card_1 == 1 or card_2 == 1:
-            self.usable_ace = 1
-            self.agent_total += 10
+        open_cards = [d_card_2]
+        self.deal_agent(open_cards)
+
+        # reset complete; return the initial state
+        return self.current_state, open_cards
+
+    def deal_agent(self, open_cards):
+        """
+        Deal a new hand to the agent against the dealer's current cards
+        :param open_cards: the cards dealt so far this step
+        :return: the initial state of the hand
+        """
+        self.bet_multiplier = 1
+        self.split_hands.clear()
+        self.finished_hands.clear()
+        if self.features is not None:
+            self.features[BETTING_FEATURE] = 0
+
+        # deal two cards to the agent; open_hand sets the total, usable ace and decision flags
+        deck = self.deck
+        card_1 = deck.deal_card()
+        card_2 = deck.deal_card()
+        open_cards.append(card_1)
+        open_cards.append(card_2)
+        self.open_hand(card_1, card_2, 0)
 
         # check to see if the agent has a natural (ace + face card)
         if self.agent_total == 21:
+            self.decision = 0
+            self.reveal_hole_card()
+            if self.features is not None:
+                self.update_hand_features()
             if self.dealer_total == 21:
-                self.current_state = 202    # tie game
+                self.current_state = TIE_STATE
             else:
-                self.current_state = 203    # agent wins
+                self.current_state = WIN_STATE
+
+        # the dealer peeks at the hole card and has a natural; the agent loses its original bet
+        elif self.rules.dealer_peek and self.dealer_total == 21:
+            self.decision = 0
+            self.reveal_hole_card()
+            if self.features is not None:
+                self.update_hand_features()
+            self.current_state = LOSS_STATE
 
-        # otherwise, deal enough cards to the agent so that the total is >11
+        # otherwise, determine the initial state
         else:
-            while self.agent_total < 12:
-                new_card = self.deck.deal_card()
-                open_cards.append(new_card)
-                self.agent_total += new_card
-                if new_card == 1 and self.usable_ace == 0 and self.agent_total < 12:
-                    self.usable_ace = 1
-                    self.agent_total += 10
+            self.current_state = self.start_hand(open_cards)
 
-            # now determine the initial state
-            self.current_state = self.get_state_index()
+        return self.current_state
 
-        # reset complete; return the initial state
-        return self.current_state, open_cards
+    def play_split_hand(self, card, open_cards):
+        """
+        Deal the second card to a hand created by a split
+        :param card: the first card of the hand
+        :param open_cards: the cards dealt so far this step
+        :return: the new state and the reward
+        """
+        new_card = self.deck.deal_card()
+        open_cards.append(new_card)
+        self.bet_multiplier = 1
+        self.open_hand(card, new_card, _SPLIT_HAND)
+
+        # split aces take a single card and stick
+        if card == 1 and not self.rules.hit_split_aces:
+            self.decision = 0
+            return self.finish_hand(self.agent_total, open_cards)
+
+        return self.start_hand(open_cards), 0
+
+    def finish_hand(self, total, open_cards):
+        """
+        Close the current hand.  If split hands are waiting, move on to the next one; otherwise the dealer plays
+        and every hand is settled
+        :param total: the final total of the hand, or 0 if it went bust
+        :param open_cards: the cards dealt so far this step
+        :return: the new state and the reward
+        """
+        # a single hand against its own dealer, the common case, is compared directly
+        if not self.finished_hands and not self.split_hands and not self.shared_dealer:
+            if self.hole_card:
+                self.reveal_hole_card()
+            if total == 0:
+                return LOSS_STATE, -self.bet_multiplier     # agent busted
+            self.play_dealer(open_cards)
+            if self.dealer_total > 21 or self.dealer_total < total:
+                return WIN_STATE, self.bet_multiplier       # dealer busted or agent wins
+            elif self.dealer_total > total:
+                return LOSS_STATE, -self.bet_multiplier     # dealer wins
+            return TIE_STATE, 0
+
+        self.finished_hands.append((total, self.bet_multiplier))
+        if self.split_hands:
+            return self.play_split_hand(self.split_hands.pop(), open_cards)
+
+        # at a table, the dealer plays once every seat has finished
+        if self.shared_dealer:
+            return WAIT_STATE, 0
+
+        # the dealer only draws if at least one hand is still standing
+        self.reveal_hole_card()
+        if self.is_standing():
+            self.play_dealer(open_cards)
+        return self.settle()
+
+    def reveal_hole_card(self):
+        """
+        Turn over the dealer's hole card at the end of the hand.  At a table, the table reveals it instead
+        :return: n/a
+        """
+        if self.hole_card:
+            self.deck.reveal(self.hole_card)
+            self.hole_card = 0
+
+    def is_standing(self):
+        """
+        :return: True if at least one of the agent's finished hands did not go bust
+        """
+        return any(hand_total for hand_total, _ in self.finished_hands)
+
+    def play_dealer(self, open_cards):
+        """
+        Play out the dealer's hand
+        :param open_cards: the cards dealt so far this step
+        :return: n/a
+        """
+        dealer_hits = self.dealer_hits
+        while dealer_hits[self.dealer_ace][self.dealer_total]:
+            new_card = self.deck.deal_card()
+            open_cards.append(new_card)
+            self.dealer_total += new_card
+            if new_card == 1 and self.dealer_ace == 0 and self.dealer_total < 12:
+                self.dealer_ace = 1
+                self.dealer_total += 10
+            if self.dealer_total > 21 and self.dealer_ace == 1:
+                self.dealer_ace = 0
+                self.dealer_total -= 10
+
+    def settle(self):
+        """
+        Compare each of the agent's finished hands to the dealer's final total
+        :return: the terminal state and the net reward over the hands
+        """
+        reward = 0
+        for hand_total, multiplier in self.finished_hands:
+            if hand_total == 0 or hand_total < self.dealer_total <= 21:
+                reward -= multiplier        # agent busted or dealer wins
+            elif self.dealer_total > 21 or hand_total > self.dealer_total:
+                reward += multiplier        # dealer busted or agent wins
+
+        if reward > 0:
+            return WIN_STATE, reward
+        elif reward < 0:
+            return LOSS_STATE, reward
+        return TIE_STATE, reward
 
     # Use the agent's action to determine the next state and reward
     def execute_action(self, action):
@@ -118,46 +527,210 @@ class Blackjack:
         reward = math.inf
         open_cards = []
 
+        # hit and stick are always legal; anything else is looked up in the precompiled action table
+        if action > HIT and action not in self.action_table[self.decision]:
+            raise ValueError(f'Action {action} is not allowed from state {self.current_state}.')
+        self.decision = 0
+
         # action is 'stick'
-        if action == 0:
-            # dealer's turn
-            while self.dealer_total < 17:
-                new_card = self.deck.deal_card()
-                open_cards.append(new_card)
-                self.dealer_total += new_card
-                if new_card == 1 and self.dealer_ace == 0 and self.dealer_total < 12:
-                    self.dealer_ace = 1
-                    self.agent_total += 10
-                if self.dealer_total > 21 and self.dealer_ace == 1:
-                    self.dealer_ace = 0
-                    self.agent_total -= 10
-            if self.dealer_total > 21:
-                # dealer busted; agent wins
-                new_state = 203
-                reward = 1
-            else:
-                if self.dealer_total > self.agent_total:
-                    # dealer wins
-                    new_state = 201
-                    reward = -1
-                elif self.dealer_total < self.agent_total:
-                    # agent wins
-                    new_state = 203
-                    reward = 1
-                else:
-                    # tie
-                    new_state = 202
-                    reward = 0
+        if action == STICK:
+            new_state, reward = self.finish_hand(self.agent_total, open_cards)
 
         # action is 'hit'
-        elif action == 1:
+        elif action == HIT:
             new_state, open_cards = self.get_next_state(open_cards)
-            if new_state == 201:
-                reward = -1
+            if new_state == LOSS_STATE:
+                new_state, reward = self.finish_hand(0, open_cards)
             else:
+                # a low opening hand that hits is no longer a two-card hand, so the rest is hit automatically
+                if self.agent_total < 12:
+                    new_state = self.auto_hit(open_cards)
                 reward = 0
 
+        # action is 'double down': double the bet, take one card and stick
+        elif action == DOUBLE:
+            self.bet_multiplier = 2
+            new_state, open_cards = self.get_next_state(open_cards)
+            total = 0 if new_state == LOSS_STATE else self.agent_total
+            new_state, reward = self.finish_hand(total, open_cards)
+
+        # action is 'split': keep the first card of the pair and park the second on the split-hand stack
+        elif action == SPLIT:
+            card = 1 if self.usable_ace else self.agent_total // 2
+            self.split_hands.append(card)
+            new_state, reward = self.play_split_hand(card, open_cards)
+
+        # action is 'surrender': give up half the bet
+        elif action == SURRENDER:
+            self.reveal_hole_card()
+            new_state = LOSS_STATE
+            reward = -0.5
+
         self.current_state = new_state
         return new_state, reward, open_cards
 
 
+class BlackjackTable:
+    """
+    Up to 7 seats playing each round against one dealer hand, all dealt from a single shared shoe.  The shoe,
+    the dealer's play and the Hi-Lo count are handled once per round rather than once per seat.  reset reshuffles
+    the shoe by itself once the cut card is reached
+    """
+
+    def __init__(self, num_seats, rules=None):
+        if not 1 <= num_seats <= 7:
+            raise ValueError('A table seats between 1 and 7 agents.')
+        self.rules = TableRules() if rules is None else rules
+        self.num_seats = num_seats
+        self.deck = None
+        self.seats = []
+        self.states = np.zeros(num_seats, dtype="int64")
+        self.rewards = np.zeros(num_seats, dtype="float64")
+        self.features = None            # optional buffer with one row per seat; see enable_features
+        self.dealer_card = 0
+        self.hole_card = 0              # the dealer's hidden card, until it is revealed at the end of the round
+        self.hi_lo_count = 0
+        self.shuffle()
+
+    def shuffle(self, deck=None):
+        """
+        Replace the shoe with freshly shuffled decks and reset the Hi-Lo count
+        :param deck: optional deck to deal from instead of a new CardDeck, e.g. an ev_tables.CompositionShoe
+        :return: n/a
+        """
+        self.deck = CardDeck() if deck is None else deck
+        self.seats = [Blackjack(self.rules, self.deck) for _ in range(self.num_seats)]
+        if self.features is not None:
+            self.attach_features()
+        for seat in self.seats:
+            seat.shared_dealer = True
+        self.hi_lo_count = 0
+
+    def get_true_count(self):
+        """
+        :return: the Hi-Lo true count, shifted and clipped into the agents' count buckets 0 through 29.  Once the
+        cut card is reached the next round comes from a fresh shoe, so the count is 0.  A shoe that is not a
+        CardDeck has no finite list of cards, and gives its own true count
+        """
+        if not isinstance(self.deck, CardDeck):
+            true_count = round(self.deck.true_count) + 15
+        elif self.needs_shuffle():
+            return 15
+        else:
+            true_count = round(self.hi_lo_count/(len(self.deck.cards)/52)) + 15
+        return min(max(true_count, 0), 29)
+
+    def needs_shuffle(self):
+        """
+        :return: True once the cut card has been reached, in which case the next reset reshuffles the shoe
+        """
+        return self.deck.needs_shuffle()
+
+    def enable_features(self):
+        """
+        Turn on a (num_seats, NUM_FEATURES) feature buffer, filled in place with one row per seat.  It is off by
+        default, so that agents that do not read it pay nothing for it
+        :return: the feature buffer
+        """
+        if self.features is None:
+            self.features = np.zeros((self.num_seats, NUM_FEATURES), dtype="float32")
+            self.attach_features()
+        return self.features
+
+    def attach_features(self):
+        # only a CardDeck tracks its composition; with any other shoe the deck-composition columns are left alone
+        if isinstance(self.deck, CardDeck):
+            self.deck.attach_features(self.features)
+        for idx, seat in enumerate(self.seats):
+            seat.features = self.features[idx]
+
+    def betting_features(self):
+        """
+        Switch every seat's row of the feature buffer to the bet-size decision made before a round is dealt,
+        turning the buffer on if needed
+        :return: the (num_seats, NUM_FEATURES) feature buffer
+        """
+        features = self.enable_features()
+        features[:, HAND_FEATURE:BETTING_FEATURE] = 0
+        features[:, BETTING_FEATURE] = 1
+        return features
+
+    def reset(self):
+        """
+        Deal a new round to the dealer and every seat, reshuffling first if the cut card has been reached
+        :return: the initial state of each seat, and the cards dealt face up
+        """
+        if self.needs_shuffle():
+            self.shuffle()
+
+        self.dealer_card = self.deck.deal_card()
+        self.hole_card = self.deck.deal_card(hidden=True)
+        dealer_total = self.dealer_card + self.hole_card
+        dealer_ace = 0
+        if self.dealer_card == 1 or self.hole_card == 1:
+            dealer_ace = 1
+            dealer_total += 10
+
+        open_cards = [self.dealer_card]
+        for idx, seat in enumerate(self.seats):
+            seat.dealer_card = self.dealer_card
+            seat.dealer_total = dealer_total
+            seat.dealer_ace = dealer_ace
+            self.states[idx] = seat.deal_agent(open_cards)
+
+        self.end_round(open_cards)
+        self.hi_lo_count += sum(HI_LO[card] for card in open_cards)
+        return self.states.copy(), open_cards
+
+    def execute_action(self, actions):
+        """
+        Apply one action for each seat still playing a hand; seats that have finished are skipped, so their
+        entries in actions are ignored.  Once no seat is left to act, the dealer plays and the waiting seats
+        are settled
+        :param actions: an array of actions, one per seat
+        :return: the new state and the reward of each seat, and the cards dealt
+        """
+        open_cards = []
+        self.rewards[:] = 0
+
+        for idx, seat in enumerate(self.seats):
+            if is_hand_state(self.states[idx]):
+                self.states[idx], self.rewards[idx], seat_cards = seat.execute_action(actions[idx])
+                open_cards.extend(seat_cards)
+
+        self.end_round(open_cards)
+        self.hi_lo_count += sum(HI_LO[card] for card in open_cards)
+        return self.states.copy(), self.rewards.copy(), open_cards
+
+    def end_round(self, open_cards):
+        """
+        Once no seat is left to act, reveal the hole card, then let the dealer play if any seat is waiting
+        :param open_cards: the cards dealt so far this step
+        :return: n/a
+        """
+        if is_hand_state(self.states).any() or not self.hole_card:
+            return
+        open_cards.append(self.hole_card)
+        self.deck.reveal(self.hole_card)
+        self.hole_card = 0
+        if (self.states == WAIT_STATE).any():
+            self.play_dealer(open_cards)
+
+    def play_dealer(self, open_cards):
+        """
+        Play out the dealer's hand once for the whole table and settle every waiting seat
+        :param open_cards: the cards dealt so far this step
+        :return: n/a
+        """
+        waiting = [idx for idx in range(self.num_seats) if self.states[idx] == WAIT_STATE]
+
+        # the dealer only draws if at least one hand is still standing
+        dealer = self.seats[waiting[0]]
+        if any(self.seats[idx].is_standing() for idx in waiting):
+            dealer.play_dealer(open_cards)
+
+        for idx in waiting:
+            seat = self.seats[idx]
+            seat.dealer_total = dealer.dealer_total
+            self.states[idx], self.rewards[idx] = seat.settle()
+            seat.current_state = self.states[idx]
@@ -0,0 +1,442 @@
+"""
+Filename: ev_tables.py
+
+Project: twentyone
+
+Description: Expected return per Hi-Lo true-count bucket for a fixed playing strategy, for checking or initializing
+the bet values that the agents learn at state 200.  Each bucket is represented by a shoe composition with that true
+count, and every card is drawn independently with the probabilities of that composition.
+
+The expected return is computed exactly by dynamic programming over the dealer's and the player's hands, including
+doubling (on any two-card total, 4-11 included), surrender and the dealer's peek.  The DP has no model of split
+hands: with resplits the hands of a split form a combinatorial tree, which is where an exact calculation becomes too
+expensive.  Strategies that split pairs are therefore simulated instead, across a process pool.  The simulation plays
+7-seat BlackjackTable rounds from a CompositionShoe.  This shoe is not a CardDeck: it draws its cards with numpy in
+large batches, from the same fixed composition as the DP, so its composition and count never change and it never
+needs reshuffling or rebuilding between rounds.  Tables are cached on
+disk, keyed by the rules, deck count and strategy.
+
+Author:
+
+Date:
+"""
+
+import hashlib
+import json
+import multiprocessing
+import os
+from functools import lru_cache
+import numpy as np
+from twentyone.environment import (BlackjackTable, TableRules, STICK, HIT, DOUBLE, SPLIT, SURRENDER, HI_LO,
+                                   LOSS_STATE, WIN_STATE, LOW_STATE, NUM_STATES, is_hand_state)
+
+# count buckets as used by the agents: bucket b holds true count b - 15
+NUM_COUNT_BUCKETS = 30
+COUNT_OFFSET = 15
+
+
+def state_index(total, soft, dealer_card):
+    """
+    :return: the environment's state code for a hand
+    """
+    if total < 12:
+        return LOW_STATE + (total - 4) + 8 * (dealer_card - 1)
+    return total - 12 + 10 * (dealer_card - 1) + 100 * soft
+
+
+def as_strategy(actions):
+    """
+    Extend an array of actions over the hand states 0-199 to all NUM_STATES state codes.  Low-total states are hit
+    unless they are already given
+    :param actions: an array of actions indexed by state code
+    :return: an array of NUM_STATES actions
+    """
+    actions = np.asarray(actions, dtype="int64")
+    strategy = np.full(NUM_STATES, HIT, dtype="int64")
+    strategy[:len(actions)] = actions
+    return strategy
+
+
+def basic_strategy():
+    """
+    A hit/stick strategy close to basic strategy
+    :return: an array of actions indexed by state code
+    """
+    strategy = np.full(NUM_STATES, HIT, dtype="int64")
+    for state in range(200):
+        total = state % 10 + 12
+        dealer_card = (state // 10) % 10 + 1
+        if state >= 100:
+            # soft hands: stick on 19 or more, and on 18 unless the dealer shows 9, 10 or an ace
+            stick = total >= 19 or (total == 18 and 2 <= dealer_card <= 8)
+        else:
+            # hard hands: stick on 17 or more, on 13-16 against 2-6, and on 12 against 4-6
+            stick = total >= 17 or (total >= 13 and 2 <= dealer_card <= 6) or (total == 12 and 4 <= dealer_card <= 6)
+        strategy[state] = STICK if stick else HIT
+    return strategy
+
+
+def basic_opening(rules):
+    """
+    basic_strategy, plus the usual doubles and surrenders on the first decision of a two-card hand where the rules
+    allow them
+    :param rules: the TableRules
+    :return: an array of actions indexed by state code
+    """
+    opening = basic_strategy()
+    for dealer_card in range(1, 11):
+        if rules.double_down:
+            # hard 9 against 3-6, hard 10 against 2-9, hard 11 against anything but an ace
+            for total, low, high in ((9, 3, 6), (10, 2, 9), (11, 2, 10)):
+                if low <= dealer_card <= high:
+                    opening[state_index(total, 0, dealer_card)] = DOUBLE
+            # soft 13-18 against the dealer's weakest cards
+            for total, low in ((13, 5), (14, 5), (15, 4), (16, 4), (17, 3), (18, 3)):
+                if low <= dealer_card <= 6:
+                    opening[state_index(total, 1, dealer_card)] = DOUBLE
+        if rules.surrender:
+            # hard 16 against 9, 10 and ace, hard 15 against 10
+            if dealer_card in (9, 10, 1):
+                opening[state_index(16, 0, dealer_card)] = SURRENDER
+            if dealer_card == 10:
+                opening[state_index(15, 0, dealer_card)] = SURRENDER
+    return opening
+
+
+def greedy_strategy(q):
+    """
+    The hit/stick strategy that is greedy with respect to an agent's q table
+    :param q: a q table whose first 200 rows are hand states and first two columns are stick and hit
+    :return: an array of actions indexed by state code
+    """
+    return as_strategy(np.asarray(q)[:200, :2].argmax(axis=1))
+
+
+def shoe_composition(true_count, num_decks=6, decks_remaining=None):
+    """
+    A representative shoe for a true count: a neutral shoe of decks_remaining decks, shifted so that its own Hi-Lo
+    sum is minus the running count of the cards already dealt (half by removing 2-6s, half by adding tens and aces)
+    :param true_count: the Hi-Lo true count
+    :param num_decks: the number of decks in a full shoe
+    :param decks_remaining: the number of decks left in the shoe; defaults to halfway between a full shoe and the
+    40% cut card used by the environments
+    :return: the number of cards of each value (ace through ten), as floats
+    """
+    if decks_remaining is None:
+        decks_remaining = num_decks * 0.7
+    composition = np.array([4.0] * 9 + [16.0]) * decks_remaining
+
+    running_count = true_count * decks_remaining
+    composition[1:6] -= running_count / 2 / 5       # 2 through 6
+    composition[9] += running_count / 2 * 4 / 5     # tens
+    composition[0] += running_count / 2 / 5         # aces
+    return np.maximum(composition, 0)
+
+
+def check_strategy(rules, strategy, opening):
+    """
+    Make sure the actions of a strategy are allowed by the rules
+    :return: n/a
+    """
+    allowed = {STICK, HIT}
+    if rules.double_down:
+        allowed.add(DOUBLE)
+    if rules.surrender:
+        allowed.add(SURRENDER)
+    if not set(np.unique(strategy)) <= {STICK, HIT}:
+        raise ValueError('strategy may only stick or hit; use opening for the first decision of a hand.')
+    if not set(np.unique(opening)) <= allowed:
+        raise ValueError(f'opening may only use the actions {sorted(allowed)} under these rules.')
+
+
+def exact_ev(probabilities, rules, strategy, opening, blackjack_payout=1.5):
+    """
+    Expected return of one hand per unit bet, drawing every card with fixed probabilities
+    :param probabilities: the probability of drawing each card value (ace through ten)
+    :param rules: the TableRules
+    :param strategy: an array of actions (stick or hit) indexed by state code
+    :param opening: an array of actions for the first decision of a two-card hand
+    :param blackjack_payout: the payout for a natural
+    :return: the expected return
+    """
+    p = [0.0] + list(probabilities)
+    cards = [card for card in range(1, 11) if p[card] > 0]
+
+    def draw(total, soft, card):
+        total += card
+        if card == 1 and not soft and total < 12:
+            total += 10
+            soft = 1
+        if total > 21 and soft:
+            total -= 10
+            soft = 0
+        return total, soft
+
+    def dealer_natural(dealer_card):
+        # the probability that the hole card completes a dealer natural
+        return p[10] if dealer_card == 1 else p[1] if dealer_card == 10 else 0.0
+
+    @lru_cache(maxsize=None)
+    def dealer(total, soft):
+        # the probability of the dealer finishing on 17, 18, 19, 20, 21 or going bust
+        if total > 21:
+            return (0.0, 0.0, 0.0, 0.0, 0.0, 1.0)
+        if total > 17 or (total == 17 and not (soft and rules.hit_soft_17)):
+            outcome = [0.0] * 6
+            outcome[total - 17] = 1.0
+            return tuple(outcome)
+        outcome = np.zeros(6)
+        for card in cards:
+            outcome += p[card] * np.array(dealer(*draw(total, soft, card)))
+        return tuple(outcome)
+
+    @lru_cache(maxsize=None)
+    def dealer_upcard(dealer_card):
+        # after a peek, the hands that are still played are those where the hole card is not a natural
+        up_total, up_soft = draw(0, 0, dealer_card)
+        natural = dealer_natural(dealer_card)
+        if not rules.dealer_peek or natural == 0 or natural == 1:
+            return dealer(up_total, up_soft)
+        outcome = np.zeros(6)
+        for card in cards:
+            if up_total + card + (10 if card == 1 else 0) != 21:
+                outcome += p[card] * np.array(dealer(*draw(up_total, up_soft, card)))
+        return tuple(outcome / (1 - natural))
+
+    @lru_cache(maxsize=None)
+    def stick(total, dealer_card):
+        outcome = dealer_upcard(dealer_card)
+        win = outcome[5] + sum(outcome[:max(total - 17, 0)])
+        loss = sum(outcome[max(total - 16, 0):5])
+        return win - loss
+
+    @lru_cache(maxsize=None)
+    def hit(total, soft, dealer_card):
+        # hands below 12 that are no longer on their opening decision are hit automatically, as strategy hits
+        # every low-total state
+        value = 0.0
+        for card in cards:
+            new_total, new_soft = draw(total, soft, card)
+            value += p[card] * (-1.0 if new_total > 21 else play(new_total, new_soft, dealer_card, strategy))
+        return value
+
+    def double(total, soft, dealer_card):
+        value = 0.0
+        for card in cards:
+            new_total, _ = draw(total, soft, card)
+            value += p[card] * (-1.0 if new_total > 21 else stick(new_total, dealer_card))
+        return 2 * value
+
+    def play(total, soft, dealer_card, actions):
+        action = actions[state_index(total, soft, dealer_card)]
+        if action == STICK:
+            return stick(total, dealer_card)
+        elif action == DOUBLE:
+            return double(total, soft, dealer_card)
+        elif action == SURRENDER:
+            return -0.5
+        return hit(total, soft, dealer_card)
+
+    ev = 0.0
+    for dealer_card in cards:
+        natural = dealer_natural(dealer_card)
+        for card_1 in cards:
+            for card_2 in cards:
+                total, soft = draw(*draw(0, 0, card_1), card_2)
+                if total == 21:
+                    ev += p[dealer_card] * p[card_1] * p[card_2] * blackjack_payout * (1 - natural)
+                    continue
+
+                # the environment keeps a low two-card hand on its opening decision only if it has an action
+                # besides hit or stick
+                if total >= 12 or rules.double_down or rules.surrender or (rules.split and card_1 == card_2):
+                    value = play(total, soft, dealer_card, opening)
+                else:
+                    value = hit(total, soft, dealer_card)
+
+                # with a peek, a dealer natural ends the hand before the agent acts
+                if rules.dealer_peek:
+                    value = -natural + (1 - natural) * value
+                ev += p[dealer_card] * p[card_1] * p[card_2] * value
+    return ev
+
+
+class CompositionShoe:
+    """
+    A shoe that never runs out: each card is drawn independently with the probabilities of a fixed composition,
+    generated with numpy a batch at a time.  It deals like a CardDeck, but has no finite list of cards; its card state
+    is always the composition and its true count is fixed by it
+    """
+
+    def __init__(self, composition, seed=None, batch_size=100000):
+        """
+        :param composition: the number of cards of each value (ace through ten)
+        :param seed: the random seed
+        :param batch_size: the number of cards drawn at once
+        """
+        composition = np.asarray(composition, dtype="float64")
+        self.composition = composition.tolist()
+        self.probabilities = composition / composition.sum()
+        # the cards left in the shoe are the negative of the cards dealt, as far as the Hi-Lo count is concerned
+        self.true_count = -np.dot(HI_LO[1:], composition) / (composition.sum() / 52)
+        self.rng = np.random.default_rng(seed)
+        self.batch_size = batch_size
+        self.batch = []
+
+    def get_card_state(self):
+        return list(self.composition)
+
+    def needs_shuffle(self):
+        return False
+
+    def deal_card(self, hidden=False):
+        if not self.batch:
+            self.batch = (self.rng.choice(10, size=self.batch_size, p=self.probabilities) + 1).tolist()
+        return self.batch.pop()
+
+    def reveal(self, card):
+        pass
+
+
+def choose_action(seat, strategy, opening, split_cards):
+    """
+    Pick a seat's action, falling back to the playing strategy if the opening action is not allowed
+    :return: the action
+    """
+    state = seat.current_state
+    if not seat.is_opening():
+        return strategy[state]
+    legal = seat.legal_actions()
+    if SPLIT in legal and (1 if seat.usable_ace else seat.agent_total // 2) in split_cards:
+        return SPLIT
+    if opening[state] in legal:
+        return opening[state]
+    return strategy[state]
+
+
+def simulate_ev(args):
+    """
+    Simulate rounds at a 7-seat table dealt from one CompositionShoe.  Takes a single tuple so that it can be mapped
+    over a process pool
+    :param args: the composition, rules, strategy, opening, split_cards, blackjack payout, number of rounds and seed
+    :return: the average return per hand
+    """
+    composition, rules, strategy, opening, split_cards, blackjack_payout, num_rounds, seed = args
+
+    table = BlackjackTable(7, rules)
+    table.shuffle(CompositionShoe(composition, seed))
+    total_return = 0.0
+    for _ in range(num_rounds):
+        states, _ = table.reset()
+
+        # at the deal, a win is a natural and a loss is a natural the dealer peeked
+        total_return += blackjack_payout * np.count_nonzero(states == WIN_STATE)
+        total_return -= np.count_nonzero(states == LOSS_STATE)
+        while is_hand_state(states).any():
+            actions = [choose_action(seat, strategy, opening, split_cards) if is_hand_state(states[idx]) else STICK
+                       for idx, seat in enumerate(table.seats)]
+            states, rewards, _ = table.execute_action(actions)
+            total_return += rewards.sum()
+
+    return total_return / (num_rounds * table.num_seats)
+
+
+def compute_ev_table(rules=None, num_decks=6, decks_remaining=None, strategy=None, opening=None, split_cards=(),
+                     blackjack_payout=1.5, method='auto', num_rounds=100000, processes=None, seed=0):
+    """
+    Expected return per unit bet for each count bucket
+    :param rules: the TableRules
+    :param num_decks: the number of decks in a full shoe
+    :param decks_remaining: the number of decks left in the representative shoes (see shoe_composition)
+    :param strategy: an array of actions (stick or hit) indexed by state code; basic_strategy() if omitted
+    :param opening: an array of actions for the first decision of a two-card hand, which may also double or
+    surrender when the rules allow; basic_opening(rules) if strategy is also omitted, else strategy
+    :param split_cards: the card values (1 for aces) whose pairs are split
+    :param blackjack_payout: the payout for a natural
+    :param method: 'exact', 'simulate', or 'auto' to simulate only what the exact DP cannot model (split pairs)
+    :param num_rounds: the number of 7-seat rounds simulated per bucket
+    :param processes: the size of the process pool used to simulate; the number of CPUs if omitted
+    :param seed: the base random seed of the simulation
+    :return: an array of the expected return for each of the NUM_COUNT_BUCKETS buckets
+    """
+    rules = TableRules() if rules is None else rules
+    strategy, opening = resolve_strategy(rules, strategy, opening)
+    check_strategy(rules, strategy, opening)
+    split_cards = tuple(split_cards) if rules.split else ()
+
+    if method == 'auto':
+        method = 'simulate' if split_cards else 'exact'
+    if method not in ('exact', 'simulate'):
+        raise ValueError('method must be one of exact, simulate, auto.')
+    if method == 'exact' and split_cards:
+        raise ValueError('Splitting pairs can only be simulated.')
+
+    compositions = [shoe_composition(bucket - COUNT_OFFSET, num_decks, decks_remaining)
+                    for bucket in range(NUM_COUNT_BUCKETS)]
+
+    if method == 'exact':
+        return np.array([exact_ev(composition / composition.sum(), rules, strategy, opening, blackjack_payout)
+                         for composition in compositions])
+
+    tasks = [(composition, rules, strategy, opening, split_cards, blackjack_payout, num_rounds, seed + bucket)
+             for bucket, composition in enumerate(compositions)]
+    with multiprocessing.Pool(processes) as pool:
+        return np.array(pool.map(simulate_ev, tasks))
+
+
+def resolve_strategy(rules, strategy, opening):
+    """
+    Fill in the default strategy and opening, and extend both over all state codes
+    :return: the strategy and the opening
+    """
+    if strategy is None:
+        strategy = basic_strategy()
+        if opening is None:
+            opening = basic_opening(rules)
+    strategy = as_strategy(strategy)
+    opening = strategy if opening is None else as_strategy(opening)
+    return strategy, opening
+
+
+def ev_table(rules=None, num_decks=6, decks_remaining=None, strategy=None, opening=None, split_cards=(),
+             blackjack_payout=1.5, method='auto', num_rounds=100000, processes=None, seed=0, cache_dir='ev_cache'):
+    """
+    compute_ev_table, cached as JSON in cache_dir under a key made from the rules, deck count and strategy.
+    See compute_ev_table for the parameters
+    :return: an array of the expected return for each of the NUM_COUNT_BUCKETS buckets
+    """
+    rules = TableRules() if rules is None else rules
+    strategy, opening = resolve_strategy(rules, strategy, opening)
+    key = {'rules': vars(rules), 'num_decks': num_decks, 'decks_remaining': decks_remaining,
+           'strategy': strategy.tolist(), 'opening': opening.tolist(), 'split_cards': sorted(split_cards),
+           'blackjack_payout': blackjack_payout, 'method': method, 'num_rounds': num_rounds, 'seed': seed}
+    digest = hashlib.sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()[:16]
+    filename = os.path.join(cache_dir, f'ev_{num_decks}_decks_{digest}.json')
+
+    if os.path.exists(filename):
+        with open(filename, 'rt') as f:
+            return np.array(json.load(f)['ev'])
+
+    ev = compute_ev_table(rules, num_decks, decks_remaining, strategy, opening, split_cards, blackjack_payout,
+                          method, num_rounds, processes, seed)
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(filename, 'wt') as f:
+        json.dump({'key': key, 'ev': ev.tolist()}, f)
+    return ev
+
+
+def bet_values(ev, bet_choice=(1, 5, 10)):
+    """
+    The value of each bet size in each count bucket, in the layout of the agents' q[count][200, :], so that a
+    learned bet ramp can be checked against it or an agent's bet values initialized from it
+    :param ev: the expected return for each count bucket
+    :param bet_choice: the bet sizes
+    :return: an array shaped (buckets, bet sizes)
+    """
+    return np.outer(ev, bet_choice)
+
+
+# if this script is being run as the main program
+if __name__ == "__main__":
+    for bucket, value in enumerate(ev_table()):
+        print(f'{bucket - COUNT_OFFSET:+d}, {value:.4f}')
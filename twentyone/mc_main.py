@@ -14,6 +14,7 @@ import math
 import numpy as np
 import Project2_agent as ag2
 import Project2_env as env2
+import ensemble as ens
 
 
 def get_agent_hand(state):
@@ -44,10 +45,12 @@ def adjust_count(cards):
     return count
 
 
-def play_blackjack(num_episodes, epsilon, decay_epsilon, hi_lo):
+def play_blackjack(num_episodes, epsilon, decay_epsilon, hi_lo, q=None, q_count=None):
     """
     Play the game of blackjack
     :param num_episodes: the number of episodes of the game to play
+    :param q: optional q table for the agent to update in place, e.g. a view into a QTableEnsemble
+    :param q_count: optional q_count table for the agent to update in place
     :return: three 1 dimensional np arrays of size num_episodes,
     the first holding the percent of episode wins by episode
     the second holding the cumulative return by episode
@@ -56,7 +59,7 @@ def play_blackjack(num_episodes, epsilon, decay_epsilon, hi_lo):
     """
     # load the environment and agent
     environment = env2.Blackjack()
-    agent = ag2.RLAgent(hi_lo)
+    agent = ag2.RLAgent(hi_lo, q, q_count)
 
     # initialize variables
     total_return = 0 # return over a set of decks
@@ -158,16 +161,22 @@ if __name__ == "__main__":
             num_episodes = 100000
             num_agents = 1
             all_player_return = np.zeros(num_episodes, dtype="float64")
-            all_player_q_values = np.zeros((204, 2), dtype="float64")
-            all_player_q_count = np.zeros((201, 2), dtype="float64")
+
+            # the agents' tables live in a memory-mapped float32 ensemble rather than in float64 arrays in memory
+            ensemble = ens.create_ensemble(f'ensemble_{choice[0]}_{choice[1]}', num_agents, 30 if hi_lo else 1,
+                                           kind='bet')
 
             # for each agent, play blackjack and increment variables that track win rate, cumulative return, and state visit rate
             # at each episode
             for i in range(num_agents):
-                cur_return, q_values, q_count = play_blackjack(num_episodes, choice[0], choice[1], hi_lo)
+                q, q_count = ensemble.agent_tables(i)
+                cur_return, _, _ = play_blackjack(num_episodes, choice[0], choice[1], hi_lo, q, q_count)
                 all_player_return += cur_return
-                all_player_q_values += q_values[0]
-                all_player_q_count += q_count[0]
+            ensemble.flush()
+
+            # average the agents' tables straight from the ensemble files
+            all_player_q_values = ensemble.mean_q()
+            all_player_q_count = ensemble.mean_q_count()
 
             # print the variables at each episode
             print(f'\nEpsilon = {choice[0]}, Decay epsilon = {choice[1]}', file=f)
@@ -178,17 +187,17 @@ if __name__ == "__main__":
 
             if not hi_lo:
                 print(f'Agent hand, usable ace, dealer hand, stick-value, hit-value, stick-count, hit-count', file=f)
-                for idx, row in enumerate(all_player_q_values):
+                for idx, row in enumerate(all_player_q_values[0]):
                     if idx < 200:
                         agent_hand, usable_ace = get_agent_hand(idx)
                         dealer_hand = get_dealer_hand(idx)
-                        print(agent_hand, usable_ace, dealer_hand, row[0]/num_agents, row[1]/num_agents, sep=',', file=f)
+                        print(agent_hand, usable_ace, dealer_hand, row[0], row[1], sep=',', file=f)
                     if idx == 200:
                         print(f'\nbet_1 value, bet_5 value, bet_10 value', file=f)
-                        print(row[0]/num_agents, row[1]/num_agents, row[2]/num_agents, sep=',', file=f)
+                        print(row[0], row[1], row[2], sep=',', file=f)
 
-            for idx, row in enumerate(q_values):
+            for idx, row in enumerate(all_player_q_values):
                 print(f'\nbet_1 value, bet_10 value', file=f)
-                print(row[200][0]/num_agents, row[200][1]/num_agents, q_count[idx][200][0], q_count[idx][200][1], sep=',', file=f)
+                print(row[200][0], row[200][1], all_player_q_count[idx][200][0], all_player_q_count[idx][200][1], sep=',', file=f)
 
 